@@ -33,47 +33,241 @@
 
 import sys
 import time
-
-def wegman_hash(x):
+import array
+import struct
+import hashlib
+import threading
+import numba
+import numpy as np
+
+try:
+    import cupy
+except ImportError:
+    cupy = None # No GPU search; see Blockchain.find_proof_gpu()
+
+def _wegman_hash_impl(x):
     '''
-    Return the wegman-hash of integer x
+    Native implementation of wegman_hash(). See wegman_hash() for details.
 
-    Note: Only the bottom 28 bits of the return value should be relied upon as
-          sufficiently random by the caller. We could explicitly zero the
-          upper bits here to make this more clear, but most callers will be
-          reducing this to a much smaller range so we don't bother with a
-          redundant mask.
+    All arithmetic here is done on fixed-width uint64 values so that numba can
+    lower the entire function to a handful of native integer ops. The product
+    of two 32-bit values fits in 64 bits, and the final sum is at most 33 bits,
+    so nothing here can overflow.
     '''
-    assert type(x) == int, "wegman_hash(): Unexpected input type"
-    assert 0 <= x <= 2**64-1, "wegman_hash(): input out-of-range"
 
     # Split into lo & hi
-    lo = (x >> 00) & 0xFFFFFFFF
-    hi = (x >> 32) & 0xFFFFFFFF
+    lo = (x >> np.uint64(00)) & np.uint64(0xFFFFFFFF)
+    hi = (x >> np.uint64(32)) & np.uint64(0xFFFFFFFF)
 
     # Add random numbers [32-bit modulo add]
-    lo = (lo + 0xACEFADE5) & 0xFFFFFFFF
-    hi = (hi + 0xBADBABE5) & 0xFFFFFFFF
+    lo = (lo + np.uint64(0xACEFADE5)) & np.uint64(0xFFFFFFFF)
+    hi = (hi + np.uint64(0xBADBABE5)) & np.uint64(0xFFFFFFFF)
 
     # Multiply
     product = lo * hi
 
     # Shift
-    product_masked  = (product >> 00) & 0xFFFFFFFF
-    product_shifted = (product >> 31) & 0xFFFFFFFF
-
-    ##
-    ## Add
-    ##
-    ## Note: this isn't restricted to 32-bits in python land, like our original
-    ##  C implementation is. The overflow bit should definitely not be
-    ##  relied upon as sufficiently random by callers, but that's true for the
-    ##  uppermost bits beneath the overflow bit, too. See function notes.
-    ##
+    product_masked  = (product >> np.uint64(00)) & np.uint64(0xFFFFFFFF)
+    product_shifted = (product >> np.uint64(31)) & np.uint64(0xFFFFFFFF)
 
+    # Add
     return product_masked + product_shifted
 
-class Transaction(dict):
+_wegman_hash_nb = numba.njit(numba.uint64(numba.uint64),cache=True,boundscheck=False)(_wegman_hash_impl)
+
+@numba.njit(numba.uint64(numba.uint64,numba.uint64),cache=True)
+def _wegman_hash_midstate_nb(hi_added, lo):
+    '''
+    Return wegman_hash(x) given the bottom 32 bits of x (<lo>) and the already-
+    added top half (<hi_added> = ((x >> 32) + 0xBADBABE5) & 0xFFFFFFFF).
+
+    When hashing a run of consecutive keys the top half rarely changes, so it
+    can be computed once (a "midstate") and only the bottom half redone per key.
+    '''
+    lo32 = np.uint32(np.uint32(lo) + np.uint32(0xACEFADE5)) # 32-bit add wraps for free
+    product = np.uint64(lo32) * hi_added                     # single 32x32->64 multiply
+    return np.uint64(np.uint32(product)) + np.uint64(np.uint32(product >> np.uint64(31)))
+
+##
+## Division-free modulo for the proof-of-work target
+##
+##  hashval % 10000000 is an integer division per candidate, which is by far the
+##  slowest op in the search loop. Since wegman_hash() never returns more than 33
+##  bits, we can instead multiply by a precomputed reciprocal and shift:
+##
+##    q = (x * ceil(2**54 / 10**7)) >> 54    (exact for all x < 2**33)
+##
+##  and x * _MOD_MAGIC still fits in a uint64, so no 128-bit multiply is needed.
+##  Exactness only has to be checked at the multiples of 10**7 below 2**33, since
+##  both sides are monotonic step functions.
+##
+
+_MOD_DIVISOR = 10000000
+_MOD_SHIFT   = 54
+_MOD_MAGIC   = -(-2**_MOD_SHIFT // _MOD_DIVISOR) # ceil(2**54 / 10**7)
+
+@numba.njit(numba.uint64(numba.uint64),cache=True)
+def _mod_10m_nb(x):
+    ''' Return x % 10000000 for any x < 2**33 (i.e. any wegman_hash() value) '''
+    q = (x * np.uint64(_MOD_MAGIC)) >> np.uint64(_MOD_SHIFT)
+    return x - q * np.uint64(_MOD_DIVISOR)
+
+@numba.njit(numba.int64(numba.uint64,numba.int64,numba.int64),cache=True)
+def _find_proof_nb(prev_proof, start, limit):
+    '''
+    Return the first proof in [start,limit) that is valid given <prev_proof>, or
+    -1 if there isn't one. See Blockchain.valid_proof() for the proof link.
+
+    This is compiled for the host CPU, so the loop body runs entirely in
+    registers with no allocator traffic; LLVM is free to use whatever vector
+    extensions (SSE/AVX2/...) the machine supports.
+
+    The guess is (prev_proof << 16) + proof, so its top 32 bits only change
+    when the bottom 32 bits wrap. We walk the range in segments that don't
+    cross a wrap and hoist the top half of the hash out of each segment.
+
+    Note: <prev_proof> is deliberately a runtime argument. Specializing a kernel
+    per prev_proof (baking it in as a compile-time constant) searched no faster,
+    since the hoisted midstate already lives in a register, and cost ~200ms of
+    compilation per block -- far longer than a typical search.
+    '''
+    base = (prev_proof & np.uint64(0xFFFFFFFF)) << np.uint64(16)
+    proof = start
+    while proof < limit:
+        guess = base + np.uint64(proof)
+        hi_added = ((guess >> np.uint64(32)) + np.uint64(0xBADBABE5)) & np.uint64(0xFFFFFFFF)
+        lo = guess & np.uint64(0xFFFFFFFF)
+        end = min(limit,proof + np.int64(np.uint64(0x100000000) - lo))
+
+        ## Note: this compare-and-branch looks like it should block vectorization,
+        ## but LLVM vectorizes the early-exit loop as-is (checking a whole vector
+        ## of lanes per branch). Hand-batching the check branchlessly (OR-ing hit
+        ## bits over groups of 64, or min-reducing over groups of 256) measured
+        ## 20-25% *slower* than this, so keep the loop simple.
+        for p in range(proof,end):
+            hashval = _wegman_hash_midstate_nb(hi_added,lo)
+            if _mod_10m_nb(hashval) == np.uint64(777777):
+                return p
+            lo += np.uint64(1)
+        proof = end
+    return -1
+
+@numba.njit(numba.int64(numba.uint64,numba.int64,numba.int64,numba.int64),cache=True,parallel=True,nogil=True)
+def _find_proof_par_nb(prev_proof, start, limit, nthreads):
+    '''
+    Multithreaded _find_proof_nb(): split [start,limit) into one contiguous
+    stripe per thread (<nthreads> total) and search them concurrently
+    (without the GIL).
+
+    Each thread stops at its own first hit, and the stripes are in order, so the
+    first stripe with a hit holds the smallest valid proof in the range. Threads
+    don't cancel each other, but the wasted work is bounded by the stripe size.
+    '''
+    stripe = (limit - start + nthreads - 1) // nthreads
+    hits = np.full(nthreads,-1,dtype=np.int64)
+    for t in numba.prange(nthreads):
+        lo = start + t*stripe
+        hi = min(limit,lo + stripe)
+        if lo < hi:
+            hits[t] = _find_proof_nb(prev_proof,lo,hi)
+    for t in range(nthreads):
+        if hits[t] >= 0:
+            return hits[t]
+    return -1
+
+## numba's default (workqueue) threading layer aborts the whole process if two
+## threads enter a parallel kernel at once, and the miner serves requests from
+## several threads. Only one batch may be in _find_proof_par_nb() at a time; it
+## already uses every core, so serializing costs no throughput.
+_PAR_KERNEL_LOCK = threading.Lock()
+
+@numba.njit(numba.boolean(numba.uint64,numba.uint64),cache=True)
+def _valid_proof_nb(proofA, proofB):
+    ''' Native Blockchain.valid_proof(). See there for the proof link. '''
+    base = (proofA & np.uint64(0xFFFFFFFF)) << np.uint64(16)
+    if proofB > np.uint64(0xFFFFFFFFFFFFFFFF) - base:
+        return False # guess doesn't fit in a wegman_hash() key
+    hashval = _wegman_hash_nb(base + proofB)
+    return _mod_10m_nb(hashval) == np.uint64(777777)
+
+@numba.njit(numba.boolean(numba.uint64[:],numba.uint64[:],numba.uint64[:]),cache=True)
+def _valid_chain_nb(proofs, prev_hashes, hashes):
+    '''
+    Return True if every block links to its predecessor, where block i has
+    proof-of-work <proofs[i]>, hash-link <prev_hashes[i]> and hash <hashes[i]>.
+    See Blockchain.valid() for the double-link. Nothing links to the final
+    block, so <hashes> may omit it.
+
+    Both links are checked in a single pass, bailing out at the first bad block.
+    '''
+    for i in range(1,len(proofs)):
+        if prev_hashes[i] != hashes[i-1]:
+            return False
+        if not _valid_proof_nb(proofs[i-1],proofs[i]):
+            return False
+    return True
+
+##
+## GPU proof search (CUDA, via cupy)
+##
+##  Same proof link as Blockchain.valid_proof(). Hits are reported with atomicMin
+##  so that, like the CPU search, we always get the smallest valid proof in the
+##  batch regardless of which thread happens to finish first. <out> must be
+##  initialized to all-ones (no hit).
+##
+##  The grid is a fixed size and each thread strides through the batch, so a
+##  single launch can cover a large batch (amortizing the launch & the copy back
+##  to the host) without needing a thread per candidate. A thread's candidates
+##  only increase, so it stops at its first hit.
+##
+
+_FIND_PROOF_CUDA_SRC = r'''
+extern "C" __global__
+void find_proof(unsigned long long base, long long start, long long n, unsigned long long* out)
+{
+    long long stride = (long long)gridDim.x * blockDim.x;
+    for (long long i = (long long)blockIdx.x * blockDim.x + threadIdx.x; i < n; i += stride)
+    {
+        unsigned long long proof = (unsigned long long)(start + i);
+        unsigned long long guess = base + proof;
+
+        // wegman_hash(guess): 32-bit adds wrap for free, one 32x32->64 multiply
+        unsigned int lo = (unsigned int)guess + 0xACEFADE5u;
+        unsigned int hi = (unsigned int)(guess >> 32) + 0xBADBABE5u;
+        unsigned long long product = (unsigned long long)lo * hi;
+        unsigned long long hashval = (unsigned long long)(unsigned int)product +
+                                     (unsigned long long)(unsigned int)(product >> 31);
+
+        if (hashval % 10000000ull == 777777ull)
+        {
+            atomicMin(out, proof);
+            return;
+        }
+    }
+}
+'''
+
+_find_proof_cuda = cupy.RawKernel(_FIND_PROOF_CUDA_SRC,'find_proof') if cupy else None
+
+def wegman_hash(x):
+    '''
+    Return the wegman-hash of integer x, where 0 <= x < 2**64
+
+    Note: Only the bottom 28 bits of the return value should be relied upon as
+          sufficiently random by the caller. We could explicitly zero the
+          upper bits here to make this more clear, but most callers will be
+          reducing this to a much smaller range so we don't bother with a
+          redundant mask.
+
+    Note: The overflow bit of the final add is preserved here, unlike in our
+          original C implementation which was restricted to 32 bits. The
+          overflow bit should definitely not be relied upon as sufficiently
+          random by callers, but that's true for the uppermost bits beneath
+          the overflow bit, too.
+    '''
+    return int(_wegman_hash_nb(x))
+
+class Transaction:
     '''
     Transaction:
         sender   <str>: Address of sender
@@ -81,147 +275,290 @@ class Transaction(dict):
         amount   <int>: Amount of TKC to transfer
 
     Implementation Notes:
-        - We inherit from dict for automatic conversion to/from JSON
+        - Fields live in __slots__ rather than a per-instance dict
 
-           We could create a similar class with a one-liner using collections.namedtuple,
-           but this implementation gives us a from_dict() factory method that we'll use to
-           recreate objects after storing & reloading from JSON.
+           Transactions are small, fixed-shape values, so there's no need for a
+           hash table per instance, and attribute access hits the slot directly.
+           Conversion to/from JSON goes through to_dict() and from_dict().
     '''
 
-    # Overide attribute accessors so instance variables can be accessed like
-    # class members (t.sender) rather than dictionary keys (t['sender'])
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
+    __slots__ = ('sender','receiver','amount','_h')
 
-    def __init__(self, sender='', receiver='', amt=0):
-        super().__init__()
-        self['sender'] = sender
-        self['receiver'] = receiver
-        self['amount'] = amt
+    # Schema: the exact set of keys every Transaction carries
+    _KEYS = frozenset(('sender','receiver','amount'))
+
+    def __init__(self, sender='', receiver='', amount=0):
+        self.sender = sender
+        self.receiver = receiver
+        self.amount = amount
+        self._h = None # See __hash__()
+
+    def __repr__(self):
+        return f'Transaction({self.sender!r}, {self.receiver!r}, {self.amount!r})'
+
+    def __eq__(self, other):
+        if type(other) is not Transaction:
+            return NotImplemented
+        return self.sender == other.sender and \
+               self.receiver == other.receiver and \
+               self.amount == other.amount
+
+    def __hash__(self):
+        # Transactions are immutable, so hash once and memoize
+        if self._h is None:
+            self._h = hash((self.sender,self.receiver,self.amount))
+        return self._h
 
     @staticmethod
     def verify(d):
         ''' Verify that dictionary d represents a valid Transaction object '''
-        assert isinstance(d,dict), "Transaction: <dict> object expected for verification"
+        if not isinstance(d,dict):
+            raise ValueError(f'Transaction::UnexpectedType: <dict> object expected for verification')
 
-        # Verify no missing keys
-        for key in Transaction().keys():
-            if key not in d.keys():
-                raise ValueError(f'Transaction::MissingKey: {key}')
+        # Verify keys (single set comparison; only dig into details on failure)
+        if d.keys() != Transaction._KEYS:
+            missing = Transaction._KEYS - d.keys()
+            if missing:
+                raise ValueError(f'Transaction::MissingKey: {", ".join(sorted(missing))}')
+            extra = d.keys() - Transaction._KEYS
+            raise ValueError(f'Transaction::UnexpectedKey: {", ".join(sorted(map(str,extra)))}')
 
-        # Verify no extra keys
-        for key in d.keys():
-            if key not in Transaction().keys():
-                raise ValueError(f'Transaction::UnexpectedKey: {key}')
+        return Transaction.verify_fields(d['sender'],d['receiver'],d['amount'])
 
-        # Verify types
-        if not isinstance(d['sender'],str) or \
-           not isinstance(d['receiver'],str):
+    @staticmethod
+    def verify_fields(sender, receiver, amount):
+        ''' Verify that the given fields make up a valid Transaction '''
+        if type(sender) is not str or \
+           type(receiver) is not str:
             raise ValueError(f'Transaction::UnexpectedType: Addresses should be strings')
-        if not isinstance(d['amount'],int):
+        if type(amount) is not int:
             raise ValueError(f'Transaction::UnexpectedType: Amount should be an integer')
+        if not -0x8000000000000000 <= amount <= 0x7FFFFFFFFFFFFFFF:
+            raise ValueError(f'Transaction::OutOfRange: Amount should fit in 64 bits (signed)')
         return True
 
     @staticmethod
     def from_dict(d):
         ''' Construct Transaction from dictionary '''
-        assert isinstance(d,dict), "Transaction: passing non-dict to from_dict()?"
-        assert Transaction.verify(d), "Transaction: Verification failed"
-        # TODO: Can we return copy.deepcopy(d) here? If so, can we eliminate the copy?
+        if not isinstance(d,dict):
+            raise ValueError(f'Transaction::UnexpectedType: from_dict() expects a <dict> object')
+        Transaction.verify(d) # Raises on failure (not an assert: must survive -O)
         return Transaction(d['sender'],d['receiver'],d['amount'])
 
-    def __hash__(self):
-        ''' Pack transaction properties into a tuple and return its hash '''
-        assert Transaction.verify(self), "Transaction: Verification failed"
-        values = [val for key,val in self.items()]
-        return hash(tuple(values))
+    def to_dict(self):
+        ''' Convert Transaction to a vanilla dictionary (e.g., for JSON) '''
+        return {'sender': self.sender, 'receiver': self.receiver, 'amount': self.amount}
+
+    def _pack(self):
+        '''
+        Serialize this transaction for Block._digest()
+
+        Each address is length-prefixed so that adjacent variable-length fields
+        can't be shifted across each other ('ab'+'c' vs 'a'+'bc').
+        '''
+        sender = self.sender.encode()
+        receiver = self.receiver.encode()
+        return b''.join((struct.pack('<Q',len(sender)),sender,
+                         struct.pack('<Q',len(receiver)),receiver,
+                         struct.pack('<q',self.amount)))
 
-class Block(dict):
+class Block:
     '''
     Block:
         transactions <list>: Transactions recorded in this block
         proof         <int>: Proof-of-work for this block
         prev_hash     <int>: Hash of previous block in the chain
-        timestamp     <int>: Timestamp of this block's creation date
+        timestamp     <int>: Timestamp of this block's creation date (ns since epoch)
+
+    Implementation Notes:
+        - Fields live in __slots__ rather than a per-instance dict, and
+          conversion to/from JSON goes through to_dict() and from_dict().
     '''
 
-    __getattr__ = dict.get
-    __setattr__ = dict.__setitem__
-    __delattr__ = dict.__delitem__
+    __slots__ = ('transactions','proof','prev_hash','timestamp','_cached_hash')
 
-    def __init__(self, transactions=[], proof=0, prev_hash=0, timestamp=time.time()):
-        super().__init__()
-        self['transactions'] = tuple(transactions) # Convert to tuple - blocks are immutable
-        self['proof'] = proof
-        self['prev_hash'] = prev_hash
-        self['timestamp'] = timestamp
+    # Schema: the exact set of keys every Block carries
+    _KEYS = frozenset(('transactions','proof','prev_hash','timestamp'))
+
+    def __init__(self, transactions=(), proof=0, prev_hash=0, timestamp=None):
+        ## The Block takes ownership of <transactions>: lists & tuples are kept
+        ## as-is rather than copied, so callers must not modify a list after
+        ## handing it over (blocks are immutable, and their hash is memoized).
+        ## Anything else (e.g. a generator) is frozen into a tuple.
+        if type(transactions) is not list and type(transactions) is not tuple:
+            transactions = tuple(transactions)
+        self.transactions = transactions
+        self.proof = proof
+        self.prev_hash = prev_hash
+        self.timestamp = time.time_ns() if timestamp is None else timestamp
+
+        self._cached_hash = None # See __hash__()
+
+    def __repr__(self):
+        return f'Block({self.transactions!r}, {self.proof!r}, {self.prev_hash!r}, {self.timestamp!r})'
+
+    def __eq__(self, other):
+        if type(other) is not Block:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
 
     @staticmethod
     def verify(d):
         ''' Verify that dictionary d represents a valid Block object '''
-        assert isinstance(d,dict), "Block: <dict> object expected for verification"
+        if not isinstance(d,dict):
+            raise ValueError(f'Block::UnexpectedType: <dict> object expected for verification')
 
-        # Verify no missing keys
-        for key in Block().keys():
-            if key not in d.keys():
-                raise ValueError(f'Block::MissingKey: {key}')
-
-        # Verify no extra keys
-        for key in d.keys():
-            if key not in Block().keys():
-                raise ValueError(f'Block::UnexpectedKey: {key}')
+        # Verify keys (single set comparison; only dig into details on failure)
+        if d.keys() != Block._KEYS:
+            missing = Block._KEYS - d.keys()
+            if missing:
+                raise ValueError(f'Block::MissingKey: {", ".join(sorted(missing))}')
+            extra = d.keys() - Block._KEYS
+            raise ValueError(f'Block::UnexpectedKey: {", ".join(sorted(map(str,extra)))}')
 
         # Verify types
-        if not isinstance(d['transactions'],list) and \
-           not isinstance(d['transactions'],tuple):
+        if not isinstance(d['transactions'],(list,tuple)):
             raise ValueError(f'Block::UnexpectedType: Transactions should be sequential container')
 
-        if not isinstance(d['proof'],int):
+        if type(d['proof']) is not int:
             raise ValueError(f'Block::UnexpectedType: proof-of-work should be an integer')
 
-        if not isinstance(d['prev_hash'],int):
+        if type(d['prev_hash']) is not int:
             raise ValueError(f'Block::UnexpectedType: hash-link should be an integer')
 
-        if not isinstance(d['timestamp'],float):
-            raise ValueError(f'Block::UnexpectedType: timestamp should be an integer')
+        if type(d['timestamp']) is not int:
+            raise ValueError(f'Block::UnexpectedType: timestamp should be an integer (ns since epoch)')
+
+        # Verify ranges (Blockchain stores these as uint64)
+        if not 0 <= d['proof'] <= 0xFFFFFFFFFFFFFFFF:
+            raise ValueError(f'Block::OutOfRange: proof-of-work should fit in 64 bits')
+
+        if not 0 <= d['prev_hash'] <= 0xFFFFFFFFFFFFFFFF:
+            raise ValueError(f'Block::OutOfRange: hash-link should fit in 64 bits')
+
+        if not 0 <= d['timestamp'] <= 0xFFFFFFFFFFFFFFFF:
+            raise ValueError(f'Block::OutOfRange: timestamp should fit in 64 bits')
 
         return True
 
     @staticmethod
-    def from_dict(d):
-        assert isinstance(d,dict), "Block: passing non-dict to from_dict()?"
-        assert Block.verify(d), "Block: Verification failed"
+    def from_dict(d, trusted=False):
+        '''
+        Construct Block from dictionary
+
+        Params:
+          d       <dict>: Block fields, e.g. as loaded from JSON
+          trusted <bool>: Skip verification of <d> and its transactions. Only
+                          for data this node produced itself; anything received
+                          from a peer must be verified.
+        '''
+        if not isinstance(d,dict):
+            raise ValueError(f'Block::UnexpectedType: from_dict() expects a <dict> object')
+
+        if trusted:
+            transactions = [Transaction(**x) if isinstance(x,dict) else x for x in d['transactions']]
+            return Block(transactions,d['proof'],d['prev_hash'],d['timestamp'])
+
+        Block.verify(d) # Raises on failure (not an assert: must survive -O)
 
         ## d['transactions'] could point to any of the following here:
         ##
         ##    -container type: list or tuple
         ##    -elemental type: dict or Transaction
         ##
-        ## The Block constructor converts to tuple type, so we don't really
-        ## care what the given container type is.
+        ## We build a fresh list of Transactions either way (which the Block
+        ## then takes ownership of), so we don't really care what the given
+        ## container type is.
         ##
-        ## If the element type is Transaction, then this is wastefully re-
-        ## constructing all of our objects, but it won't do any true harm.
-        ## If the element type is raw dictionaries, then this converts to
-        ## the Transaction type that our blockchain will be expecting.
+        ## If the element type is Transaction, the object is immutable and its
+        ## keys are fixed by __slots__, so it's shared as-is once its fields pass
+        ## verify_fields() (which raises otherwise). If the element type is raw
+        ## dictionaries, then this converts to the Transaction type that our
+        ## blockchain will be expecting.
         ##
         ## Typically, from_dict() is called with data loaded from a json,
         ## so we primarily expect a list of raw dictionaries here.
-        transactions = [Transaction.from_dict(x) for x in d['transactions']]
+        transactions = [x if type(x) is Transaction and
+                             Transaction.verify_fields(x.sender,x.receiver,x.amount) else
+                        Transaction.from_dict(x)
+                        for x in d['transactions']]
         return Block(transactions,d['proof'],d['prev_hash'],d['timestamp'])
 
+    def to_dict(self):
+        ''' Convert Block to a vanilla dictionary (e.g., for JSON) '''
+        return {
+            'transactions' : [t.to_dict() for t in self.transactions],
+            'proof'        : self.proof,
+            'prev_hash'    : self.prev_hash,
+            'timestamp'    : self.timestamp,
+        }
+
+    def _digest(self):
+        '''
+        Hash all Block parameters into a single non-negative 63-bit value.
+
+        The fields (and each transaction's fields) are packed into one flat,
+        fixed-layout byte buffer which is digested in one shot by blake2b. There's
+        no recursive walk through Python's generic hash(), and unlike hash(), the
+        result doesn't depend on the process's string-hash seed, so hash-links
+        computed by one node check out on every other node.
+
+        Note: The wegman hash is still what makes proof-of-work hard, but it's a
+              poor fit for hash-links, where all that matters is that a tampered
+              block can't be made to collide with the original. Every field is
+              range-checked by verify() and packed at its full width, so distinct
+              blocks never share a buffer. blake2b is also faster than folding
+              small blocks through wegman_hash, as it skips the trip into numba.
+
+        Note: The digest is truncated to 63 bits, not 64. CPython re-hashes any
+              __hash__() result that doesn't fit in a signed 64-bit int, so a
+              full 64-bit digest would make hash(block) differ from this value
+              for about half of all blocks.
+        '''
+        header = struct.pack('<QQQ',self.proof,self.prev_hash,self.timestamp)
+        buf = b''.join([header] + [t._pack() for t in self.transactions])
+        return int.from_bytes(hashlib.blake2b(buf,digest_size=8).digest(),'little') & 0x7FFFFFFFFFFFFFFF
+
     def __hash__(self):
-        ''' Pack Block parameters into a tuple and return its hash '''
-        assert Block.verify(self), "Block: Verification failed"
-        values = [val for key,val in self.items()]
-        return hash(tuple(values))
+        ''' Return Block hash '''
+
+        ##
+        ## Blocks are immutable, so hash once and memoize
+        ##
+        ##  Blockchain.valid() and mine_block() both hash every block they link
+        ##  against, so recomputing this would redo the full walk over all
+        ##  transactions each time. We don't hash eagerly in the constructor,
+        ##  though, since plenty of blocks (e.g. those in a peer's chain that
+        ##  we end up rejecting on length) are never hashed at all.
+        ##
+        if self._cached_hash is None:
+            self._cached_hash = self._digest()
+        return self._cached_hash
 
 class Blockchain(list):
     '''
     Blockchain:
         self <list>: List of Blocks representing this chain
         current_transactions <list>: List of pending transactions for next block
+
+    Implementation Notes:
+        - The scalar fields of every block are mirrored into parallel numpy arrays
+          (_proofs, _prev_hashes, _timestamps) as blocks are appended.
+
+           Validation only needs proofs & hash-links, and walking those as
+           contiguous uint64 buffers is far cheaper than chasing a dict per block.
+           The arrays are over-allocated and grown geometrically, so the first
+           num_blocks entries are the live ones. Blocks must therefore only be
+           added to the chain through append() (or extend()); the list methods
+           that would rewrite existing blocks raise TypeError.
+
+        - Pending amounts are likewise kept in a flat int64 array (_amounts), so
+          aggregate queries like pending_total() don't walk the Transactions.
+
+        - Validation is incremental: _validated_up_to is the length of the
+          prefix of the chain already known to be valid, so valid() only checks
+          the blocks added since the last call (and mine_block() extends the
+          prefix directly, since it checks its own links).
     '''
 
     def __init__(self):
@@ -231,6 +568,46 @@ class Blockchain(list):
         '''
         super().__init__()
         self.current_transactions = []
+        self._amounts = array.array('q') # Amounts of current_transactions
+        self._proofs = np.zeros(16,dtype=np.uint64)
+        self._prev_hashes = np.zeros(16,dtype=np.uint64)
+        self._timestamps = np.zeros(16,dtype=np.uint64)
+        self._validated_up_to = 0
+
+    def append(self, block):
+        ''' Add <block> to the end of the chain '''
+        n = len(self)
+        if n == len(self._proofs):
+            self._proofs = np.concatenate((self._proofs,np.zeros_like(self._proofs)))
+            self._prev_hashes = np.concatenate((self._prev_hashes,np.zeros_like(self._prev_hashes)))
+            self._timestamps = np.concatenate((self._timestamps,np.zeros_like(self._timestamps)))
+        self._proofs[n] = block.proof
+        self._prev_hashes[n] = block.prev_hash
+        self._timestamps[n] = block.timestamp
+        super().append(block)
+
+    def extend(self, blocks):
+        ''' Add each of <blocks> to the end of the chain (through append()) '''
+        for block in blocks:
+            self.append(block)
+
+    def __iadd__(self, blocks):
+        self.extend(blocks)
+        return self
+
+    ##
+    ## Every other list mutator is disabled
+    ##
+    ##   They'd rewrite or reorder blocks behind the numpy mirrors and behind
+    ##   _validated_up_to, so valid() would keep vouching for a prefix that no
+    ##   longer exists. Chains only ever grow at the end; anything else should
+    ##   build a new chain with from_list().
+    ##
+    def _append_only(self, *args, **kwargs):
+        raise TypeError('Blockchain::AppendOnly: blocks can only be added with append() or extend()')
+
+    insert = __setitem__ = __delitem__ = __imul__ = _append_only
+    pop = remove = clear = reverse = sort = _append_only
 
     @staticmethod
     def init(seed=77):
@@ -248,8 +625,16 @@ class Blockchain(list):
         return chain
 
     @staticmethod
-    def from_list(L):
-        ''' Construct a Blockchain from a vanilla list '''
+    def from_list(L, trusted=False):
+        '''
+        Construct a Blockchain from a vanilla list
+
+        Params:
+          L       <list>: Blocks, e.g. as loaded from JSON
+          trusted <bool>: Skip per-block verification (see Block.from_dict)
+        Returns:
+          chain <Blockchain>: Newly created chain
+        '''
         chain = Blockchain()
 
         ##
@@ -263,9 +648,47 @@ class Blockchain(list):
         ##   case at this point since it's wholly unexpected.
         ##
         for b in L:
-            chain.append(Block.from_dict(b))
+            chain.append(Block.from_dict(b if isinstance(b,dict) else b.to_dict(),trusted))
         return chain
 
+    @staticmethod
+    def from_list_validated(L):
+        '''
+        Construct a Blockchain from a vanilla list, validating it along the way
+
+        This is equivalent to from_list(L) followed by valid(), fused into a
+        single pass: each link is checked as soon as its block is built, so a bad
+        chain is dropped at its first bad block rather than after materializing
+        (and hashing) the whole thing.
+
+        Params:
+          L <list>: Blocks, e.g. as received from a peer
+        Returns:
+          chain <Blockchain>: Newly created chain, or None if it isn't valid
+                              (including any block that fails Block.verify)
+        '''
+        if not L:
+            return None # Empty chains are invalid
+
+        chain = Blockchain()
+        for b in L:
+            if type(b) is Block:
+                b = b.to_dict()
+            try:
+                block = Block.from_dict(b)
+                if chain and not Blockchain.check_block(chain[-1],block):
+                    return None
+            except ValueError:
+                return None # Malformed block (or one we can't even digest)
+            chain.append(block)
+
+        chain._validated_up_to = len(chain)
+        return chain
+
+    def to_list(self):
+        ''' Convert Blockchain to a vanilla list of dictionaries (e.g., for JSON) '''
+        return [b.to_dict() for b in self]
+
     @staticmethod
     def valid_proof(proofA, proofB):
         ''' Return true if <proofB> is a valid proof-of-work given prior proof <proofA> '''
@@ -335,19 +758,124 @@ class Blockchain(list):
         ## could potentially produce this problem.
         ##
 
-        guess = ((proofA & 0xFFFFFFFF) << 16) + proofB
-        hashval = wegman_hash(guess)
-        return hashval % 10000000 == 777777 # modulo 10,000 --> reading bottom ~14 bits of hashval
+        ##   guess = ((proofA & 0xFFFFFFFF) << 16) + proofB
+        ##   hashval = wegman_hash(guess)
+        ##   return hashval % 10000000 == 777777 # modulo 10,000 --> reading bottom ~14 bits of hashval
+        ##
+        ## The link itself is evaluated natively by _valid_proof_nb(), which is
+        ## shared with the chain-validation kernel used by valid().
+        ##
+        if not 0 <= proofB <= 0xFFFFFFFFFFFFFFFF:
+            return False # guess doesn't fit in a wegman_hash() key
+        return _valid_proof_nb(proofA & 0xFFFFFFFF,proofB)
+
+    _PROGRESS_FMT = 'guess = {}...\r'
+    _PROGRESS_INTERVAL = 1.0 # Seconds
+    _last_progress = 0.0     # time.monotonic() of the last progress report
+
+    @staticmethod
+    def _report_progress(guess):
+        '''
+        Report search progress (called once per batch, never per candidate;
+        the kernels themselves contain no progress code)
+
+        Reports are throttled to one per _PROGRESS_INTERVAL, and skipped entirely
+        unless stdout is a terminal, so a slow or full pipe can't stall a search.
+        '''
+        now = time.monotonic()
+        if now - Blockchain._last_progress < Blockchain._PROGRESS_INTERVAL:
+            return
+        Blockchain._last_progress = now
+        if sys.stdout.isatty():
+            sys.stdout.write(Blockchain._PROGRESS_FMT.format(guess))
+            sys.stdout.flush()
+
+    @staticmethod
+    def find_proof(prev_proof, start=0, batch=1<<20, threaded=False):
+        '''
+        Search for the smallest valid proof-of-work >= <start> given prior proof
+        <prev_proof>.
+
+        Candidates are handed to the native search kernel <batch> at a time, so
+        the interpreter is only re-entered once per batch (to report progress).
+        The kernel must agree exactly with valid_proof() & wegman_hash() above.
+
+        Params:
+          prev_proof <int>: Proof-of-work of the prior block
+          start      <int>: First candidate to try
+          batch      <int>: Number of candidates searched per kernel call
+          threaded  <bool>: Split each batch across all cores
+        Returns:
+          proof <int>: Smallest proof >= <start> such that valid_proof(prev_proof,proof)
+        '''
+        nthreads = numba.get_num_threads() if threaded else 1
+        while True:
+            if nthreads > 1:
+                with _PAR_KERNEL_LOCK:
+                    proof = _find_proof_par_nb(prev_proof & 0xFFFFFFFF,start,start+batch,nthreads)
+            else:
+                proof = _find_proof_nb(prev_proof & 0xFFFFFFFF,start,start+batch)
+            if proof >= 0:
+                return proof
+            start += batch
+            Blockchain._report_progress(start)
+
+    @staticmethod
+    def find_proof_gpu(prev_proof, start=0, batch=1<<26):
+        '''
+        Search for the smallest valid proof-of-work >= <start> on a CUDA GPU.
+
+        Each kernel launch tests <batch> candidates, spread over a fixed grid of
+        GPU threads, and only a single uint64 is copied back to the host per
+        launch.
+
+        Params:
+          prev_proof <int>: Proof-of-work of the prior block
+          start      <int>: First candidate to try
+          batch      <int>: Number of candidates searched per kernel launch
+        Returns:
+          proof <int>: Smallest proof >= <start> such that valid_proof(prev_proof,proof)
+        '''
+        if cupy is None:
+            raise RuntimeError('find_proof_gpu(): cupy is not installed')
+
+        NO_HIT = 0xFFFFFFFFFFFFFFFF
+        THREADS = 256
+        MAX_BLOCKS = 4096 # Plenty to fill any current GPU; threads stride past this
+        base = (prev_proof & 0xFFFFFFFF) << 16
+        out = cupy.full(1,NO_HIT,dtype=cupy.uint64)
+        while True:
+            blocks = min(MAX_BLOCKS,(batch + THREADS - 1) // THREADS)
+            _find_proof_cuda((blocks,),(THREADS,),(np.uint64(base),np.int64(start),np.int64(batch),out))
+            proof = int(out.get()[0])
+            if proof != NO_HIT:
+                return proof
+            start += batch
+            Blockchain._report_progress(start)
+
+    @staticmethod
+    def check_block(prev_block, block):
+        '''
+        Return True if <block> correctly links to <prev_block> (see valid()).
+
+        This checks a single link, so a chain can be checked block-by-block as
+        it's being built and abandoned at its first bad link. To check a whole
+        chain that's already built, valid() is much faster.
+        '''
+        return block.prev_hash == hash(prev_block) and \
+               Blockchain.valid_proof(prev_block.proof,block.proof)
 
     def valid(self):
         ''' Return True if this instance represents a valid chain '''
 
+        n = len(self)
+
         # Empty chains are invalid
-        if self.num_blocks == 0:
+        if n == 0:
             return False
 
         # All single-block chains are valid
-        if self.num_blocks == 1:
+        if n == 1:
             return True
 
         ##
@@ -375,17 +903,16 @@ class Blockchain(list):
         ##    I think you could. This would effectively merge the hash-link within the
         ##    proof-of-work link.
         ##
-        for i in range(1,self.num_blocks):
-            block = self[i]
-            last_block = self[i-1]
-            print(f'Verifying block{i}:')
-            print(block)
-            print(f' hash_check: {block.prev_hash == hash(last_block)}')
-            print(f'proof_check: {Blockchain.valid_proof(last_block.proof,block.proof)}')
-            if block.prev_hash != hash(last_block) or \
-               not Blockchain.valid_proof(last_block.proof,block.proof):
-                return False
+        ## Blocks are immutable & only ever appended, so links within the prefix
+        ## we've already validated can't have changed. Resume from the last block
+        ## of that prefix (the first new block links back to it).
+        ##
+        lo = max(self._validated_up_to,1) - 1
+        hashes = np.fromiter((hash(self[i]) for i in range(lo,n-1)),dtype=np.uint64,count=n-1-lo)
+        if not _valid_chain_nb(self._proofs[lo:n],self._prev_hashes[lo:n],hashes):
+            return False
 
+        self._validated_up_to = n
         return True
 
     def mine_block(self, proof):
@@ -399,19 +926,26 @@ class Blockchain(list):
           NewBlock <Block>: Generated block
         '''
         # Validate genesis block
-        if self.num_blocks == 0:
+        n = len(self)
+        if n == 0:
             raise ValueError('Missing genesis block?')
 
         # Validate proof
-        if not self.valid_proof(self.last_block.proof,proof):
+        last_block = self[n-1]
+        if not Blockchain.valid_proof(last_block.proof,proof):
             raise ValueError('Invalid proof-of-work')
 
-        # Create block
-        block = Block(self.current_transactions,proof,hash(self.last_block))
+        # Create block (handing over the pending list; it's replaced below)
+        block = Block(self.current_transactions,proof,hash(last_block))
 
-        self.append(block)              # Add block to the chain
-        self.current_transactions = []  # Reset pending transactions
-        return block                    # Return new block
+        self.append(block)                  # Add block to the chain
+        self.current_transactions = []      # Reset pending transactions
+        self._amounts = array.array('q')
+
+        # Both links to the new block were just checked above
+        if self._validated_up_to == n:
+            self._validated_up_to = n + 1
+        return block                        # Return new block
 
     def new_transaction(self, sender, receiver, amt):
         '''
@@ -425,10 +959,19 @@ class Blockchain(list):
         Returns:
           idx <int>: index of to-be-created parent block
         '''
+        # Check before touching any state: a bad transaction would otherwise
+        # be mined, and then break the digest of its block (and the chain).
+        # This includes the int64 range check, so _amounts can't overflow below.
+        Transaction.verify_fields(sender,receiver,amt) # Raises ValueError on failure
 
+        self._amounts.append(amt)
         self.current_transactions.append(Transaction(sender,receiver,amt))
         return self.num_blocks
 
+    def pending_total(self):
+        ''' Return the total amount of TKC in pending transactions '''
+        return sum(self._amounts)
+
     @property
     def MINE_ADDR(self):
         ''' Node address reserved for successful mine '''
@@ -19,16 +19,34 @@
 
 import sys
 import uuid
+import threading
 import flask
+import flask.json.provider
 import requests
 import argparse
 
 from urllib.parse import urlparse
-from blockchain import Blockchain
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from blockchain import Transaction, Block, Blockchain
+
+try:
+    from orjson import loads as json_loads, dumps as json_dumps
+except ImportError:
+    import json # Slower, but always available
+    json_loads = json.loads
+    def json_dumps(obj, default=None):
+        return json.dumps(obj,default=default).encode() # Match orjson.dumps(), which returns bytes
+
+try:
+    from waitress import serve
+except ImportError:
+    serve = None # Fall back to Flask's development server; see main()
 
 class HTTP:
     OK = 200
     Created = 201
+    NotModified = 304
     BadRequest = 400
     NotFound = 404
 # End HTTP
@@ -39,12 +57,25 @@ class Miner:
         ID           <str>: Miner's address used in TKC transactions
         chain <Blockchain>: Miner's local copy of the blockchain
         peers        <set>: Set of other active Miners
+        session  <Session>: Persistent HTTP session (keep-alive) for talking to peers
+        fetch_pool  <Pool>: Persistent thread pool for fetching from peers concurrently
+        lock       <RLock>: Guards mutation of chain (requests are served concurrently)
     '''
 
+    # Max number of peers we talk to at once (and keep connections open to)
+    MAX_FETCHES = 32
+
     def __init__(self):
         self.peers = set()
         self.ID = str(uuid.uuid4()).replace('-','')
         self.chain = Blockchain.init()
+        self.session = requests.Session()
+        self.session.mount('http://',HTTPAdapter(pool_connections=Miner.MAX_FETCHES,pool_maxsize=Miner.MAX_FETCHES))
+        self.fetch_pool = ThreadPoolExecutor(max_workers=Miner.MAX_FETCHES) # Threads start on demand
+        self.lock = threading.RLock()
+        self._chain_json = None # Cached serialization of chain; see chain_json()
+        self._chain_etag = None
+        self._peer_etags = {}   # ETag of the last chain received from each peer
 
     def new_transaction(self, sender, receiver, amt):
         ## TODO: Should we save pending transactions here, in Miner, instead of
@@ -57,7 +88,8 @@ class Miner:
         ##  chain are lost, which seems like a problem. How are transactions
         ##  recorded and synchronized in real bitcoin?
         ##
-        return self.chain.new_transaction(sender,receiver,amt)
+        with self.lock:
+            return self.chain.new_transaction(sender,receiver,amt)
 
     def register_node(self, addr):
         '''
@@ -66,14 +98,16 @@ class Miner:
           addr <str>: Address to register (example: http://localhost:123)
         '''
         url = urlparse(addr)
-        self.peers.add(url.netloc)
+        with self.lock:
+            self.peers.add(url.netloc)
 
     @staticmethod
-    def proof_of_work(last_proof):
+    def proof_of_work(last_proof, start=0, backend='cuda'):
         '''
         Search for valid proof given the last proof.
 
-        The current implementation is a brute-force search. Can we
+        The current implementation is a brute-force search, on the GPU or split
+        across all cores in batches of candidates (see Blockchain.find_proof). Can we
         invert the wegman hash to improve performance here? Are
         bitcoin miners distinguished by cleverness in this search
         algorithm, or merely in the speed at which they can brute-
@@ -81,13 +115,28 @@ class Miner:
 
         Is zero the best place to start here? Would it be faster if
         we started from the last_proof (and looped back around if
-        necessary)?
+        necessary)? Every candidate is equally likely to hit, so probably
+        not, but <start> makes it easy to try. There's no need to offset
+        or stride separate workers by hand, either: the CPU search already
+        gives each core its own disjoint stripe of every batch.
+
+        Params:
+          last_proof <int>: Proof-of-work of the last block
+          start      <int>: First candidate to try
+          backend    <str>: 'cuda' to search on the GPU (falling back to the CPU
+                            if cupy or a GPU isn't available), or 'cpu'
+        Returns:
+          proof <int>: Smallest valid proof >= <start> (the same on either backend)
         '''
-        proof = 0
-        while not Blockchain.valid_proof(last_proof,proof):
-            proof += 1
-            if proof % 100000 == 0:
-                print(f'guess = {proof}...\r',end='',flush=True)
+        if backend == 'cuda':
+            try:
+                return Blockchain.find_proof_gpu(last_proof,start)
+            except RuntimeError:
+                pass # No cupy/GPU - fall back to the CPU search
+        elif backend != 'cpu':
+            raise ValueError(f'Miner::UnknownBackend: {backend}')
+
+        proof = Blockchain.find_proof(last_proof,start,batch=1<<22,threaded=True)
         return proof
 
     def mine_block(self):
@@ -95,10 +144,70 @@ class Miner:
         Find proof-of-work and mint new block.
         Returns the successful proof-of-work.
         '''
-        new_proof = self.proof_of_work(self.chain.last_block.proof)
-        self.new_transaction(self.chain.MINE_ADDR,self.ID,1)
-        next_block = self.chain.mine_block(new_proof)
-        return new_proof
+        ##
+        ## The search runs without holding the lock (it releases the GIL, too), so
+        ## other requests are served while we mine. If the chain moved on in the
+        ## meantime (another block was mined, or the chain was replaced during
+        ## consensus), our proof is stale and we search again.
+        ##
+        while True:
+            chain = self.chain
+            n = len(chain)
+            new_proof = self.proof_of_work(chain.last_block.proof)
+            with self.lock:
+                if self.chain is not chain or len(chain) != n:
+                    continue
+                self.new_transaction(chain.MINE_ADDR,self.ID,1)
+                next_block = chain.mine_block(new_proof)
+                self._chain_json = None
+            return new_proof
+
+    def fetch_chain(self, node, timeout=5):
+        '''
+        Request the full chain from a peer node.
+
+        Params:
+          node    <str>: Peer address (netloc, e.g. localhost:123)
+          timeout <int>: Seconds to wait on the peer before giving up
+        Returns:
+          response <requests.Response>: Peer's response, or None if unreachable
+          etag                   <str>: ETag of the peer's chain, or None
+
+        Note: The ETag is only returned, not recorded. The caller records it
+              (see resolve_conflicts) once it's done evaluating the chain.
+        '''
+        ## Peers answer 304 (Not Modified) if their chain hasn't changed since
+        ## we last evaluated it. Whatever we concluded about it then still holds,
+        ## since our own chain never gets shorter.
+        etag = self._peer_etags.get(node)
+        headers = {'If-None-Match': etag} if etag else None
+        try:
+            response = self.session.get(f'http://{node}/chain',headers=headers,timeout=timeout)
+        except requests.RequestException:
+            return None, None
+        if response.status_code != HTTP.OK:
+            return response, None
+        return response, response.headers.get('ETag')
+
+    def chain_json(self):
+        '''
+        Serialize chain for peers.
+
+        Serializing walks every block & transaction, and peers poll for the chain
+        far more often than it changes, so the result is cached until the chain
+        next changes (a block is mined or the chain is replaced).
+
+        Returns:
+          body <bytes>: JSON object holding the chain
+          etag   <str>: Entity tag identifying this version of the chain
+        '''
+        with self.lock:
+            if self._chain_json is None:
+                ## Our chain is valid, so its head's hash pins down every block
+                ## behind it via the hash-links.
+                self._chain_json = json_dumps({'chain': self.chain.to_list()})
+                self._chain_etag = f'{self.chain.num_blocks}-{hash(self.chain.last_block):016x}'
+            return self._chain_json, self._chain_etag
 
     def resolve_conflicts(self):
         ''' Sync chains across active nodes '''
@@ -115,24 +224,94 @@ class Miner:
 
         print(f'resolve_conflicts(): len(self) = {self.chain.num_blocks}')
 
-        for i,node in enumerate(self.peers):
-            # Request full chain from peer node
-            response = requests.get(f'http://{node}/chain')
+        ##
+        ## Request full chains from all peer nodes concurrently
+        ##
+        ##  Fetching is pure network wait, so with one thread per peer the whole
+        ##  round costs the slowest peer's latency rather than the sum of all of
+        ##  them. Parsing & validation below stay serial.
+        ##
+        ##  The pool is kept for the Miner's lifetime, so rounds don't pay to spin
+        ##  up (and tear down) a fresh set of threads.
+        ##
+        with self.lock:
+            peers = list(self.peers)
+        responses = list(self.fetch_pool.map(self.fetch_chain,peers))
+
+        candidates = []
+        etags = {} # ETags of the peer chains evaluated this round
+        for i,(node,(response,etag)) in enumerate(zip(peers,responses)):
+            if response is None or response.status_code != HTTP.OK:
+                continue # Node failure (or chain unchanged) - ignore corresponding chain
+
+            # Parse the raw bytes directly (response.json() would decode to str first)
+            try:
+                raw_chain = json_loads(response.content)['chain']
+                if not isinstance(raw_chain,list):
+                    raise ValueError('chain should be a list')
+            except (ValueError,KeyError,TypeError):
+                continue # Malformed response - ignore corresponding chain
+
+            if etag:
+                etags[node] = etag
+
+            print(f'resolve_conflicts(): Checking chain #{i} [len={len(raw_chain)}]')
+
+            # Only a longer chain can dominate, so don't bother building or
+            # validating anything else
+            if len(raw_chain) > len(self.chain):
+                candidates.append(raw_chain)
+
+        ##
+        ## Check candidates for the dominant chain, longest first
+        ##
+        ##  Only the longest valid chain can win, so once one checks out, none of
+        ##  the (shorter) remaining candidates need to be built or validated at
+        ##  all. sorted() is stable, so ties still go to the first peer.
+        ##
+        for raw_chain in sorted(candidates,key=len,reverse=True):
+            alt_chain = Blockchain.from_list_validated(raw_chain)
+            if alt_chain is None:
+                continue # Invalid chain
+
+            with self.lock:
+                if len(alt_chain) > len(self.chain): # Recheck: we may have mined since
+                    changed = True
+                    self.chain = alt_chain
+                    self._chain_json = None
+            break # Remaining candidates are no longer
+
+        ## Only now that every chain we received has been dealt with is it safe to
+        ## skip them next round: recording ETags as responses arrived meant that
+        ## a round that failed part-way would have us ignore those peers forever.
+        self._peer_etags.update(etags)
+        return changed
 
-            if response.status_code != HTTP.OK:
-                continue # Node failure - ignore corresponding chain
+def _json_default(obj):
+    ''' Serialize our own types for json_dumps() '''
+    if isinstance(obj,Blockchain):
+        return obj.to_list()
+    if isinstance(obj,(Block,Transaction)):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
 
-            # Convert from vanilla list to Blockchain
-            alt_chain = Blockchain.from_list(response.json()['chain'])
+class JSONProvider(flask.json.provider.JSONProvider):
+    '''
+    Flask JSON provider backed by json_dumps() & json_loads() (i.e., orjson when
+    it's available), so request bodies and flask.jsonify() both go through it.
+    Blockchains, Blocks & Transactions are serialized via to_list()/to_dict().
+    '''
 
-            print(f'resolve_conflicts(): Checking chain #{i} [len={alt_chain.num_blocks}]')
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj,default=_json_default).decode()
 
-            # Check for dominant chain
-            if len(alt_chain) > len(self.chain) and alt_chain.valid():
-                changed = True
-                self.chain = alt_chain
+    def loads(self, s, **kwargs):
+        return json_loads(s)
 
-        return changed
+    def response(self, *args, **kwargs):
+        ''' Like the base response(), but hands json_dumps()'s bytes straight through '''
+        obj = self._prepare_response_obj(args,kwargs)
+        return self._app.response_class(json_dumps(obj,default=_json_default),mimetype='application/json')
 
 ##
 ## Globals
@@ -140,6 +319,7 @@ class Miner:
 
 miner = Miner()
 app = flask.Flask('TKBC')
+app.json = JSONProvider(app)
 
 @app.route('/register', methods=['POST'])
 def register_node():
@@ -165,6 +345,8 @@ def new_transaction():
         idx = miner.new_transaction(req['sender'],req['receiver'],req['amount'])
     except KeyError as e:
         return "Missing sender/receiver/amount", HTTP.BadRequest
+    except ValueError as e:
+        return str(e), HTTP.BadRequest
 
     ack = {
         'message' : f'Transaction will be added to block {idx}'
@@ -174,10 +356,10 @@ def new_transaction():
 
 @app.route('/chain', methods=['GET'])
 def full_chain():
-    ack = {
-        'chain' : miner.chain
-    }
-    return flask.jsonify(ack), HTTP.OK
+    body, etag = miner.chain_json()
+    response = flask.Response(body,status=HTTP.OK,mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(flask.request) # 304 if the peer is up to date
 
 @app.route('/mine', methods=['GET'])
 def mine():
@@ -228,11 +410,19 @@ def main():
         num_proofs += 1
 
     ##
-    ## Start the Flask server
+    ## Start the server
+    ##
+    ##  Mining a block takes a while, so requests are served from a pool of
+    ##  threads; otherwise a /mine would stall every /chain request from our
+    ##  peers until it finished. Waitress is preferred if it's installed, since
+    ##  Flask's built-in server is only meant for development.
     ##
 
     print('Starting server...')
-    app.run(host='0.0.0.0',port=args.port)
+    if serve:
+        serve(app,host='0.0.0.0',port=args.port,threads=8)
+    else:
+        app.run(host='0.0.0.0',port=args.port,threaded=True)
     return
 
 